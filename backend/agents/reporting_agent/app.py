@@ -1,5 +1,7 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from flask import Flask, request, jsonify
 from vertexai.preview import generative_models
 from vertexai import init
@@ -11,6 +13,9 @@ from typing import Dict, Optional
 
 app = Flask(__name__)
 
+# Small pool for overlapping independent GCS / Firestore reads within a request
+io_pool = ThreadPoolExecutor(max_workers=4)
+
 # --- Configuration ---
 # Initialize Vertex AI
 init(project="adsp-34002-ip07-visionary-ai", location="us-central1")
@@ -48,13 +53,17 @@ def get_most_recent_image(chat_id: str,
         bucket = client.bucket(bucket_name)
         
         prefix = f"chats/{chat_id}/"
-        blobs = list(bucket.list_blobs(prefix=prefix))
+        # Field mask keeps the listing small; pages stream straight into max()
+        most_recent_blob = max(
+            bucket.list_blobs(prefix=prefix, fields="items(name,updated),nextPageToken"),
+            key=lambda b: b.updated,
+            default=None,
+        )
         
-        if not blobs:
+        if most_recent_blob is None:
             print(f"No images found for chat_id: {chat_id}")
             return None
         
-        most_recent_blob = max(blobs, key=lambda b: b.updated)
         gcs_path = f"gs://{bucket_name}/{most_recent_blob.name}"
         
         print(f"✓ Most recent image: {gcs_path}")
@@ -65,15 +74,15 @@ def get_most_recent_image(chat_id: str,
         print(f"ERROR getting image: {e}")
         return None
 
-def get_chat_metadata(chat_id: str) -> Dict:
+def get_chat_document(chat_id: str) -> Optional[Dict]:
     """
-    Fetch metadata from Firestore for a chat
+    Fetch the chat document from Firestore (one read serves metadata + history)
     
     Args:
         chat_id: Chat document ID
     
     Returns:
-        Metadata dictionary
+        Document data, or None if missing / on error
     """
     try:
         db = firestore.client()
@@ -82,53 +91,91 @@ def get_chat_metadata(chat_id: str) -> Dict:
         
         if not doc.exists:
             print(f"No document found for chat_id: {chat_id}")
-            return {}
-        
-        doc_data = doc.to_dict()
-        metadata = doc_data.get('metadata', {})
+            return None
         
-        print(f"✓ Metadata retrieved for chat {chat_id}: {metadata}")
-        return metadata
+        return doc.to_dict()
     except Exception as e:
-        print(f"ERROR getting metadata: {e}")
+        print(f"ERROR getting chat document: {e}")
+        return None
+
+def get_chat_metadata(chat_id: str, doc_data: Optional[Dict] = None) -> Dict:
+    """
+    Fetch metadata from Firestore for a chat
+    
+    Args:
+        chat_id: Chat document ID
+        doc_data: Already-fetched chat document (skips the Firestore read)
+    
+    Returns:
+        Metadata dictionary
+    """
+    if doc_data is None:
+        doc_data = get_chat_document(chat_id)
+    if not doc_data:
         return {}
+    
+    metadata = doc_data.get('metadata', {})
+    
+    print(f"✓ Metadata retrieved for chat {chat_id}: {metadata}")
+    return metadata
 
-def get_chat_history_from_firestore(chat_id: str) -> list:
+def get_chat_history_from_firestore(chat_id: str, doc_data: Optional[Dict] = None) -> list:
     """
     Fetch chat history from Firestore
     
     Args:
         chat_id: Chat document ID
+        doc_data: Already-fetched chat document (skips the Firestore read)
     
     Returns:
         List of message dictionaries
     """
-    try:
-        db = firestore.client()
-        doc_ref = db.collection('chats').document(chat_id)
-        doc = doc_ref.get()
-        
-        if not doc.exists:
-            print(f"No chat history found for chat_id: {chat_id}")
-            return []
-        
-        doc_data = doc.to_dict()
-        messages = doc_data.get('messages', [])
-        
-        # Convert to standard format
-        history = []
-        for msg in messages:
-            history.append({
-                "role": msg.get("role", "user"),
-                "content": msg.get("content", ""),
-                "timestamp": msg.get("timestamp", "")
-            })
-        
-        print(f"✓ Chat history retrieved: {len(history)} messages")
-        return history
-    except Exception as e:
-        print(f"ERROR getting chat history: {e}")
+    if doc_data is None:
+        doc_data = get_chat_document(chat_id)
+    if not doc_data:
+        print(f"No chat history found for chat_id: {chat_id}")
         return []
+    
+    # Convert to standard format
+    history = [
+        {
+            "role": msg.get("role", "user"),
+            "content": msg.get("content", ""),
+            "timestamp": msg.get("timestamp", "")
+        }
+        for msg in doc_data.get('messages', [])
+    ]
+    
+    print(f"✓ Chat history retrieved: {len(history)} messages")
+    return history
+
+@lru_cache(maxsize=128)
+def _describe_image(image_path: str) -> str:
+    """
+    Gemini Vision description of a GCS image, memoized by path.
+    
+    Upload paths are timestamped and never overwritten, so a path always
+    names the same image; retried/regenerated reports reuse the description.
+    Errors propagate (and are therefore not cached).
+    """
+    model = generative_models.GenerativeModel("gemini-2.0-flash-exp")
+    
+    prompt = "Describe in detail what you see in this image. Focus on any visible skin conditions, lesions, discolorations, or abnormalities if this is a dermatological image, or dental/oral conditions if this is an oral health image."
+    
+    # Determine mime type from file extension
+    mime_type = "image/jpeg"
+    if image_path.lower().endswith('.png'):
+        mime_type = "image/png"
+    elif image_path.lower().endswith('.webp'):
+        mime_type = "image/webp"
+    
+    # Generate content using GCS URI
+    response = model.generate_content([
+        prompt,
+        generative_models.Part.from_uri(image_path, mime_type=mime_type)
+    ])
+    
+    return response.text.strip()
 
 def analyze_image_with_gemini(image_path: str) -> str:
     """
@@ -141,24 +188,7 @@ def analyze_image_with_gemini(image_path: str) -> str:
         Description of what's in the image
     """
     try:
-        model = generative_models.GenerativeModel("gemini-2.0-flash-exp")
-        
-        prompt = "Describe in detail what you see in this image. Focus on any visible skin conditions, lesions, discolorations, or abnormalities if this is a dermatological image, or dental/oral conditions if this is an oral health image."
-        
-        # Determine mime type from file extension
-        mime_type = "image/jpeg"
-        if image_path.lower().endswith('.png'):
-            mime_type = "image/png"
-        elif image_path.lower().endswith('.webp'):
-            mime_type = "image/webp"
-        
-        # Generate content using GCS URI
-        response = model.generate_content([
-            prompt,
-            generative_models.Part.from_uri(image_path, mime_type=mime_type)
-        ])
-        
-        description = response.text.strip()
+        description = _describe_image(image_path)
         
         print(f"✓ Image analyzed: {description[:100]}...")
         return description
@@ -231,8 +261,13 @@ Rules:
 - Focus on oral health, dental issues, gum diseases, and mouth-related conditions.
 """
 
+# Compact JSON for prompt payloads: no indentation whitespace, non-ASCII kept as-is
+# (indent=2 and \uXXXX escapes only add input tokens the model has to read)
+PROMPT_JSON = {"separators": (",", ":"), "ensure_ascii": False}
+
 def generate_report(chat_history: list, cv_result: dict, metadata: dict, 
-                   image_path: str = None, chat_type: str = "skin") -> dict:
+                   image_path: str = None, chat_type: str = "skin",
+                   image_description: Optional[str] = None) -> dict:
     """
     Generate a structured medical report using Gemini.
     
@@ -242,6 +277,8 @@ def generate_report(chat_history: list, cv_result: dict, metadata: dict,
         metadata: User metadata (age, gender, etc.)
         image_path: Path to the uploaded image
         chat_type: Type of consultation - "skin" or "oral"
+        image_description: Gemini Vision description of the image, if the
+            caller already has one (skips a second analysis call)
     
     Returns:
         dict: Structured report
@@ -249,11 +286,12 @@ def generate_report(chat_history: list, cv_result: dict, metadata: dict,
     print(f"---REPORTING AGENT: Generating {chat_type} report...---")
     
     try:
-        # Analyze image with Gemini Vision
-        image_description = ""
-        if image_path:
-            print("📸 Analyzing image with Gemini Vision...")
-            image_description = analyze_image_with_gemini(image_path)
+        # Analyze image with Gemini Vision (unless the caller already did)
+        if image_description is None:
+            image_description = ""
+            if image_path:
+                print("📸 Analyzing image with Gemini Vision...")
+                image_description = analyze_image_with_gemini(image_path)
         
         # Select persona based on chat_type
         if chat_type.lower() == "oral":
@@ -271,16 +309,16 @@ def generate_report(chat_history: list, cv_result: dict, metadata: dict,
         # Build the prompt
         prompt = f"""
 Chat history:
-{json.dumps(chat_history, indent=2)}
+{json.dumps(chat_history, **PROMPT_JSON)}
 
 Computer vision model output:
-{json.dumps(cv_result, indent=2)}
+{json.dumps(cv_result, **PROMPT_JSON)}
 
 Image analysis (what Gemini sees in the image):
 {image_description}
 
 User metadata from Firestore:
-{json.dumps(metadata, indent=2)}
+{json.dumps(metadata, **PROMPT_JSON)}
 
 Image path: {image_path if image_path else 'Not provided'}
 
@@ -346,9 +384,6 @@ def generate_report_endpoint():
                 "error": "chat_type must be either 'skin' or 'oral'"
             }), 400
         
-        # Initialize variables
-        chat_history_before = []
-        
         # Check if chat_id is provided (Firebase mode)
         if "chat_id" in data:
             print(f"\n📥 Loading data from Firebase for chat_id: {data['chat_id']}")
@@ -361,23 +396,22 @@ def generate_report_endpoint():
                     "error": "cv_result is required when using chat_id"
                 }), 400
             
-            # Load data from Firebase/GCS
+            # Load data from Firebase/GCS (independent reads, run concurrently)
             print("📥 Fetching image from GCS...")
-            image_path = get_most_recent_image(chat_id)
+            image_future = io_pool.submit(get_most_recent_image, chat_id)
             
-            print("📥 Fetching metadata from Firestore...")
-            metadata = get_chat_metadata(chat_id)
+            print("📥 Fetching chat document from Firestore...")
+            chat_doc = get_chat_document(chat_id) or {}
+            image_path = image_future.result()
+            metadata = get_chat_metadata(chat_id, chat_doc)
             
             # Check if chat_history is provided in the request, otherwise fetch from Firestore
             if "chat_history" in data and data["chat_history"]:
                 print("✓ Using chat_history from request payload")
                 chat_history = data.get("chat_history", [])
-                chat_history_before = chat_history.copy()
             else:
-                print("📥 Fetching chat history from Firestore...")
-                chat_history = get_chat_history_from_firestore(chat_id)
-                # Store the original chat history from Firebase
-                chat_history_before = chat_history.copy() if chat_history else []
+                print("📥 Using chat history from the Firestore document...")
+                chat_history = get_chat_history_from_firestore(chat_id, chat_doc)
             
         else:
             # Direct mode - data provided in request
@@ -392,33 +426,31 @@ def generate_report_endpoint():
             
             chat_id = data.get("chat_id", "direct_mode")
             chat_history = data.get("chat_history", [])
-            # Store the original chat history from request
-            chat_history_before = chat_history.copy() if chat_history else []
             cv_result = data.get("cv_result", {})
             metadata = data.get("metadata", {})
             image_path = data.get("image_path")
         
+        # Prepare image description once; it feeds both the report prompt and the response
+        # (analyze_image_with_gemini handles its own errors and never raises)
+        image_description = ""
+        if image_path:
+            print("📸 Analyzing image with Gemini Vision...")
+            image_description = analyze_image_with_gemini(image_path)
+        
+        # Nothing below mutates chat_history, so the "before" view can share it
+        chat_history_before = chat_history or []
+        
         # Generate report
         print(f"\n🤖 Generating {chat_type} report with Gemini...")
-        report = generate_report(chat_history, cv_result, metadata, image_path, chat_type)
+        report = generate_report(chat_history, cv_result, metadata, image_path, chat_type,
+                                 image_description=image_description)
         
         # Add the AI response to chat history
-        chat_history_after = chat_history_before.copy() if chat_history_before else []
-        chat_history_after.append({
+        chat_history_after = [*chat_history_before, {
             "role": "assistant",
             "content": report.get("output", ""),
             "timestamp": datetime.utcnow().isoformat()
-        })
-        
-        # Prepare image description
-        image_description = ""
-        if image_path:
-            try:
-                print("📸 Analyzing image for output...")
-                image_description = analyze_image_with_gemini(image_path)
-            except Exception as e:
-                print(f"Warning: Could not analyze image: {e}")
-                image_description = "Image analysis unavailable"
+        }]
         
         # Return comprehensive output
         return jsonify({
@@ -465,59 +497,62 @@ def health_check():
         "supported_types": ["skin", "oral"]
     })
 
-@app.route("/", methods=["GET"])
-def root():
-    """Root endpoint with API documentation"""
-    return jsonify({
-        "service": "Medical Reporting Agent (Skin & Oral)",
-        "version": "3.0",
-        "features": [
-            "Firebase/Firestore integration",
-            "GCS image retrieval",
-            "Automatic metadata loading",
-            "Structured medical reports",
-            "Multi-specialty support (Dermatology & Dentistry)",
-            "Gemini Vision image analysis via Vertex AI"
-        ],
-        "endpoints": {
-            "/generate_report": "POST - Generate structured medical report",
-            "/health": "GET - Health check"
-        },
-        "usage": {
-            "option_1_firebase": {
-                "description": "Load data from Firebase/GCS using chat_id",
-                "example": {
-                    "chat_type": "skin",
-                    "chat_id": "9vEu1qRQ1lgphdnpN5mO",
-                    "cv_result": {
-                        "prediction": "Eczema",
-                        "confidence": 0.87
-                    }
-                }
-            },
-            "option_2_direct": {
-                "description": "Provide all data directly",
-                "example": {
-                    "chat_type": "oral",
-                    "chat_history": [
-                        {"role": "user", "content": "I have bleeding gums"}
-                    ],
-                    "cv_result": {
-                        "prediction": "Gingivitis",
-                        "confidence": 0.82
-                    },
-                    "metadata": {
-                        "age": "28",
-                        "gender": "male"
-                    }
+# Static API documentation served by the root endpoint (built once at import)
+API_DOCS = {
+    "service": "Medical Reporting Agent (Skin & Oral)",
+    "version": "3.0",
+    "features": [
+        "Firebase/Firestore integration",
+        "GCS image retrieval",
+        "Automatic metadata loading",
+        "Structured medical reports",
+        "Multi-specialty support (Dermatology & Dentistry)",
+        "Gemini Vision image analysis via Vertex AI"
+    ],
+    "endpoints": {
+        "/generate_report": "POST - Generate structured medical report",
+        "/health": "GET - Health check"
+    },
+    "usage": {
+        "option_1_firebase": {
+            "description": "Load data from Firebase/GCS using chat_id",
+            "example": {
+                "chat_type": "skin",
+                "chat_id": "9vEu1qRQ1lgphdnpN5mO",
+                "cv_result": {
+                    "prediction": "Eczema",
+                    "confidence": 0.87
                 }
             }
         },
-        "chat_types": {
-            "skin": "Dermatology consultation - skin conditions",
-            "oral": "Dental/Oral health consultation - teeth, gums, mouth"
+        "option_2_direct": {
+            "description": "Provide all data directly",
+            "example": {
+                "chat_type": "oral",
+                "chat_history": [
+                    {"role": "user", "content": "I have bleeding gums"}
+                ],
+                "cv_result": {
+                    "prediction": "Gingivitis",
+                    "confidence": 0.82
+                },
+                "metadata": {
+                    "age": "28",
+                    "gender": "male"
+                }
+            }
         }
-    })
+    },
+    "chat_types": {
+        "skin": "Dermatology consultation - skin conditions",
+        "oral": "Dental/Oral health consultation - teeth, gums, mouth"
+    }
+}
+
+@app.route("/", methods=["GET"])
+def root():
+    """Root endpoint with API documentation"""
+    return jsonify(API_DOCS)
 
 # --- Start Flask App ---
 if __name__ == "__main__":
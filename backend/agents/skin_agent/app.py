@@ -4,6 +4,7 @@
 
 import os
 import json
+import threading
 from flask import Flask, request, jsonify
 from typing import TypedDict, Annotated, Literal
 from datetime import datetime
@@ -39,6 +40,16 @@ class DermatologyState(TypedDict):
     current_response: Annotated[str, "Current agent response"]
     should_end: Annotated[bool, "Whether to end the conversation"]
 
+# Scalar fields copied straight from Gemini's extracted_info into state when present
+EXTRACTED_SCALAR_FIELDS = (
+    "age",
+    "gender",
+    "skin_cancer_history",
+    "family_cancer_history",
+    "body_region",
+    "duration",
+)
+
 # =============================================================================
 # COMBINED AGENT FUNCTION (SINGLE API CALL)
 # =============================================================================
@@ -67,7 +78,7 @@ CURRENT PATIENT INFORMATION:
 - Skin cancer history: {state.get('skin_cancer_history', 'Not provided')}
 - Family cancer history: {state.get('family_cancer_history', 'Not provided')}
 - Body region: {state.get('body_region', 'Not provided')}
-- Symptoms: {json.dumps(state.get('symptoms', {}), indent=2)}
+- Symptoms: {json.dumps(state.get('symptoms', {}), separators=(',', ':'), ensure_ascii=False)}
 - Duration: {state.get('duration', 'Not provided')}
 - Other info: {state.get('other_information', 'Not provided')}
 
@@ -143,28 +154,23 @@ RESPONSE GUIDELINES:
         
         # 1. Update extracted information
         extracted = result.get('extracted_info', {})
-        if extracted.get('age'):
-            state['age'] = extracted['age']
-        if extracted.get('gender'):
-            state['gender'] = extracted['gender']
-        if extracted.get('skin_cancer_history'):
-            state['skin_cancer_history'] = extracted['skin_cancer_history']
-        if extracted.get('family_cancer_history'):
-            state['family_cancer_history'] = extracted['family_cancer_history']
-        if extracted.get('body_region'):
-            state['body_region'] = extracted['body_region']
-        if extracted.get('duration'):
-            state['duration'] = extracted['duration']
-        if extracted.get('other_information'):
+        for field in EXTRACTED_SCALAR_FIELDS:
+            value = extracted.get(field)
+            if value:
+                state[field] = value
+        other_information = extracted.get('other_information')
+        if other_information:
             current_other = state.get('other_information', '')
-            state['other_information'] = f"{current_other}\n{extracted['other_information']}".strip()
+            state['other_information'] = f"{current_other}\n{other_information}".strip()
         
         # Update symptoms
-        if extracted.get('symptoms'):
+        extracted_symptoms = extracted.get('symptoms')
+        if extracted_symptoms:
+            # Merge in place; unanswered (None) symptoms never overwrite earlier answers
             current_symptoms = state.get('symptoms', {})
-            for symptom, value in extracted['symptoms'].items():
-                if value is not None:
-                    current_symptoms[symptom] = value
+            current_symptoms.update(
+                {symptom: value for symptom, value in extracted_symptoms.items() if value is not None}
+            )
             state['symptoms'] = current_symptoms
         
         # 2. Update assessment
@@ -239,32 +245,46 @@ def create_dermatology_workflow():
 # Initialize workflow
 workflow = create_dermatology_workflow()
 
+# Striped locks: /chat reads the checkpointed state, appends to chat_history and
+# writes it back; concurrent requests for the same consultation (gunicorn threads)
+# would otherwise lose messages. A fixed pool keeps memory flat however many
+# consultations a worker sees; consultations that share a stripe just take turns.
+THREAD_LOCK_STRIPES = 64
+_thread_locks = tuple(threading.Lock() for _ in range(THREAD_LOCK_STRIPES))
+
+def _thread_lock(thread_id: str) -> threading.Lock:
+    """Lock guarding the read-modify-write of one consultation's state"""
+    return _thread_locks[hash(thread_id) % THREAD_LOCK_STRIPES]
+
 # =============================================================================
 # FLASK API ENDPOINTS
 # =============================================================================
 
+# Static API documentation served by the root endpoint (built once at import)
+API_DOCS = {
+    "service": "Skin Specialist Agent (Optimized)",
+    "version": "2.0",
+    "description": "LangGraph-based dermatology consultation agent with single-call optimization",
+    "endpoints": {
+        "/start": "POST - Start a new consultation",
+        "/chat": "POST - Send a message in an existing consultation",
+        "/state": "GET - Get current state of a consultation",
+        "/health": "GET - Health check"
+    },
+    "features": [
+        "Standard chat_history format",
+        "Optimized: Single API call per message",
+        "Stateful conversations with thread management",
+        "Intelligent question generation",
+        "Automatic image request when ready"
+    ],
+    "optimization": "Combines extraction + assessment + generation in ONE Gemini call"
+}
+
 @app.route("/", methods=["GET"])
 def root():
     """Root endpoint with API documentation"""
-    return jsonify({
-        "service": "Skin Specialist Agent (Optimized)",
-        "version": "2.0",
-        "description": "LangGraph-based dermatology consultation agent with single-call optimization",
-        "endpoints": {
-            "/start": "POST - Start a new consultation",
-            "/chat": "POST - Send a message in an existing consultation",
-            "/state": "GET - Get current state of a consultation",
-            "/health": "GET - Health check"
-        },
-        "features": [
-            "Standard chat_history format",
-            "Optimized: Single API call per message",
-            "Stateful conversations with thread management",
-            "Intelligent question generation",
-            "Automatic image request when ready"
-        ],
-        "optimization": "Combines extraction + assessment + generation in ONE Gemini call"
-    })
+    return jsonify(API_DOCS)
 
 @app.route("/health", methods=["GET"])
 def health_check():
@@ -382,47 +402,48 @@ def chat():
         
         config = {"configurable": {"thread_id": thread_id}}
         
-        # Get current state or initialize
-        try:
-            current_state = workflow.get_state(config).values
-        except:
-            current_state = {
-                "chat_history": provided_chat_history if provided_chat_history else [],
-                "age": "",
-                "gender": "",
-                "skin_cancer_history": "",
-                "family_cancer_history": "",
-                "body_region": "",
-                "symptoms": {},
-                "duration": "",
-                "other_information": "",
-                "information_complete": False,
-                "next_action": "ask_question",
-                "current_response": "",
-                "should_end": False
-            }
-        
-        # If chat_history provided in request, use it (allows external state management)
-        if provided_chat_history:
-            current_state["chat_history"] = provided_chat_history
-        
-        # Add user message to chat_history
-        current_state["chat_history"].append({
-            "role": "user",
-            "content": user_message
-        })
-        
-        # Run the workflow (single API call happens here)
-        result = workflow.invoke(current_state, config)
-        
-        # Get agent's response
-        agent_response = result.get("current_response", "")
-        
-        # Add agent response to chat_history
-        result["chat_history"].append({
-            "role": "assistant",
-            "content": agent_response
-        })
+        with _thread_lock(thread_id):
+            # Get current state or initialize
+            try:
+                current_state = workflow.get_state(config).values
+            except:
+                current_state = {
+                    "chat_history": provided_chat_history if provided_chat_history else [],
+                    "age": "",
+                    "gender": "",
+                    "skin_cancer_history": "",
+                    "family_cancer_history": "",
+                    "body_region": "",
+                    "symptoms": {},
+                    "duration": "",
+                    "other_information": "",
+                    "information_complete": False,
+                    "next_action": "ask_question",
+                    "current_response": "",
+                    "should_end": False
+                }
+            
+            # If chat_history provided in request, use it (allows external state management)
+            if provided_chat_history:
+                current_state["chat_history"] = provided_chat_history
+            
+            # Add user message to chat_history
+            current_state["chat_history"].append({
+                "role": "user",
+                "content": user_message
+            })
+            
+            # Run the workflow (single API call happens here)
+            result = workflow.invoke(current_state, config)
+            
+            # Get agent's response
+            agent_response = result.get("current_response", "")
+            
+            # Add agent response to chat_history
+            result["chat_history"].append({
+                "role": "assistant",
+                "content": agent_response
+            })
         
         return jsonify({
             "status": "success",
@@ -0,0 +1,85 @@
+"""
+Shared HTTP session + id/JSON helpers for the supervisor test scripts
+One keep-alive pool per process, reused by every tester
+"""
+
+import itertools
+import json
+import os
+import socket
+import time
+from typing import Optional
+
+try:
+    import orjson
+    _dumps, _loads = orjson.dumps, orjson.loads
+except ImportError:  # stdlib fallback when orjson isn't installed locally
+    _dumps, _loads = (lambda obj: json.dumps(obj).encode()), json.loads
+
+# requests/urllib3 are imported in get_session() so that importing this module
+# (and running a script's --help) doesn't pay for the HTTP stack
+_session: Optional["requests.Session"] = None
+
+# Unique even when several ids (or several scripts, e.g. parallel CI jobs) are
+# minted in the same second: the pid keeps processes apart, the time keeps reruns
+# of a reused pid apart, and the counter keeps ids within a process apart.
+# The pid is shifted past the timestamp's 32 bits so the two never overlap.
+_ID_SEQ = itertools.count((os.getpid() << 32 | int(time.time())) * 1000)
+
+
+def _keepalive_adapter(**kwargs) -> "requests.adapters.HTTPAdapter":
+    """HTTPAdapter whose sockets flush small writes immediately and stay alive"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+
+    class KeepAliveAdapter(HTTPAdapter):
+        # urllib3's defaults already include TCP_NODELAY; keep them and add SO_KEEPALIVE
+        SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs["socket_options"] = self.SOCKET_OPTIONS
+            super().init_poolmanager(*args, **kwargs)
+
+    return KeepAliveAdapter(**kwargs)
+
+
+def get_session() -> "requests.Session":
+    """Singleton requests session (lazy)."""
+    global _session
+    if _session is None:
+        import requests
+        from urllib3.util.retry import Retry
+
+        # Retry covers connection errors and idempotent 502/503/504s only;
+        # urllib3 never replays POSTs, so chat messages are not double-sent.
+        # raise_on_status=False hands back the last 5xx response once retries
+        # run out, so tests can still assert on it instead of catching RetryError
+        adapter = _keepalive_adapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.1,
+                status_forcelist=[502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def fresh_id(prefix: str) -> str:
+    """Unique test id, e.g. test_chat_23568277720479000.
+
+    The number is ((pid << 32) | unix_seconds) * 1000 plus a per-process call count.
+    """
+    return f"{prefix}_{next(_ID_SEQ)}"
+
+
+def json_body(response) -> dict:
+    """Decode a JSON response body (orjson straight from bytes when available)."""
+    return _loads(response.content)
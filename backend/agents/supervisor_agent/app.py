@@ -10,6 +10,7 @@ import httpx
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, ValidationError
 
@@ -93,7 +94,9 @@ def validate_payload(req: SupervisorRequest):
 # ---------------------------------------------------------------------
 # CORE APP
 # ---------------------------------------------------------------------
-app = FastAPI(title="Supervisor Agent", version="3.3")
+# ORJSONResponse: report payloads are large nested dicts; orjson serializes them
+# in one native pass instead of the stdlib json encoder.
+app = FastAPI(title="Supervisor Agent", version="3.3", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -108,10 +111,11 @@ http = HttpClient(timeout=25, retries=2)
 db = FirestoreService()
 
 
-@app.get("/health")
+# HEAD lets probes and test scripts check liveness without a body
+@app.api_route("/health", methods=["GET", "HEAD"])
 async def health(): return {"status": "ok"}
 
-@app.get("/ready")
+@app.api_route("/ready", methods=["GET", "HEAD"])
 async def ready(): return {"status": "ready"}
 
 
@@ -128,7 +132,7 @@ async def _log_user_message(req: SupervisorRequest):
     }
     if req.type == "image":
         doc["image"] = req.image_url
-    db.save_message(req.chat_id, doc)
+    await asyncio.to_thread(db.save_message, req.chat_id, doc)
 
 async def _log_bot_message(req: SupervisorRequest, response: AgentResponse):
     bot_doc = {
@@ -138,23 +142,24 @@ async def _log_bot_message(req: SupervisorRequest, response: AgentResponse):
         "text": response.response,
         "createdAt": datetime.utcnow(),
     }
-    db.save_message(req.chat_id, bot_doc)
+    await asyncio.to_thread(db.save_message, req.chat_id, bot_doc)
 
 
 # ---------------------------------------------------------------------
 # AGENT ROUTING
 # ---------------------------------------------------------------------
-async def _route_text(req: SupervisorRequest) -> AgentResponse:
+async def _route_text(req: SupervisorRequest, history: List[Dict[str, str]]) -> AgentResponse:
     """
     Route text messages from the Supervisor Agent to Skin/Oral Agents.
     Ensures payload matches the expected format of the downstream /chat API.
+    `history` is req.history already converted to plain dicts by main_entry.
     """
     print("🔍 Request:", req, flush=True)
     agent_url = (
         SKIN_AGENT_URL if req.speciality == "skin" else ORAL_AGENT_URL
     )
     # 🧩 Build chat history cleanly for multi-turn flow
-    chat_history = [ {"role": h.role, "content": h.content} for h in req.history ]
+    chat_history = list(history)
 
     # Only append current message if it's not already the last message in history
     # (prevents duplication since the agent will also add it)
@@ -188,15 +193,8 @@ async def _route_text(req: SupervisorRequest) -> AgentResponse:
         collected_info = data.get("collected_info", {})
         
         # Save collected_info to Firestore chat document for later use
-        if collected_info:
-            try:
-                db.db.collection("chats").document(req.chat_id).set(
-                    {"user_metadata": collected_info},
-                    merge=True  # Merge with existing data, latest values overwrite
-                )
-                print(f"✅ Saved collected_info to Firestore: {collected_info}")
-            except Exception as e:
-                print(f"⚠️  Could not save collected_info to Firestore: {e}")
+        if collected_info and await asyncio.to_thread(db.save_user_metadata, req.chat_id, collected_info):
+            print(f"✅ Saved collected_info to Firestore: {collected_info}")
         
         meta = {
             "thread_id": data.get("thread_id"),
@@ -219,7 +217,7 @@ async def _route_text(req: SupervisorRequest) -> AgentResponse:
         raise HTTPException(status_code=502, detail=f"Downstream {agent_url} error: {e}")
 
 
-async def _route_image_then_report(req: SupervisorRequest) -> AgentResponse:
+async def _route_image_then_report(req: SupervisorRequest, history: List[Dict[str, str]]) -> AgentResponse:
     """Send image to Vision Agent, then Reporting Agent."""
     
     # Vision Agent - send with image_url
@@ -231,7 +229,12 @@ async def _route_image_then_report(req: SupervisorRequest) -> AgentResponse:
         "message_type": "image",
     }
     print("🔍 Vision payload:", vision_payload, flush=True)
-    vision = await http.post_json(VISION_AGENT_URL, vision_payload)
+    # collected_info (saved during text conversations) doesn't depend on the vision
+    # result, so read it from Firestore while the Vision Agent call is in flight.
+    vision, collected_info = await asyncio.gather(
+        http.post_json(VISION_AGENT_URL, vision_payload),
+        asyncio.to_thread(db.get_user_metadata, req.chat_id),
+    )
     print("🔍 Vision response:", vision, flush=True)
     
     # Check if image is valid
@@ -250,7 +253,7 @@ async def _route_image_then_report(req: SupervisorRequest) -> AgentResponse:
                 "error_type": "image_validation_failed"
             }
         )
-        await _log_bot_message(req, response)
+        # main_entry logs the returned response; logging here too stored it twice
         return response
     
     # Image is valid - extract prediction result
@@ -265,25 +268,14 @@ async def _route_image_then_report(req: SupervisorRequest) -> AgentResponse:
         "confidence": prediction_result.get("confidence", 0.0),
     }
 
-    db.log_vision_result(req.chat_id, {
+    await asyncio.to_thread(db.log_vision_result, req.chat_id, {
         "speciality": req.speciality,
         "diagnosis": diagnosis["diagnosis_name"],
         "confidence": diagnosis["confidence"],
     })
     
-        # Get collected_info from Firestore (saved during text conversations)
-    collected_info = {}
-    try:
-        chat_doc_ref = db.db.collection("chats").document(req.chat_id)
-        chat_doc = chat_doc_ref.get()
-        if chat_doc.exists:
-            chat_data = chat_doc.to_dict()
-            collected_info = chat_data.get("user_metadata", {})
-            print(f"✅ Retrieved user_metadata from Firestore: {collected_info}")
-        else:
-            print("⚠️  Chat document not found in Firestore, user_metadata will be empty")
-    except Exception as e:
-        print(f"⚠️  Could not fetch user_metadata from Firestore: {e}")
+    if collected_info:
+        print(f"✅ Retrieved user_metadata from Firestore: {collected_info}")
 
     # Reporting Agent
     report_payload = {
@@ -291,7 +283,7 @@ async def _route_image_then_report(req: SupervisorRequest) -> AgentResponse:
         "chat_id": req.chat_id,
         "speciality": req.speciality,
         "type": "report",
-        "history": [h.model_dump() for h in req.history],
+        "history": history,
         "diagnosis": diagnosis,
         "image_url": req.image_url,
         "metadata": collected_info,
@@ -327,7 +319,7 @@ async def _route_image_then_report(req: SupervisorRequest) -> AgentResponse:
     final = ok(req.chat_id, report_output, "report", meta)
     
     # Save full report to Firestore
-    db.save_report(req.chat_id, {
+    await asyncio.to_thread(db.save_report, req.chat_id, {
         "diagnosis": diagnosis_from_report, 
         "report": report_data,  # Save the complete report structure
         "full_report_response": report  # Optionally save the entire response for debugging
@@ -347,33 +339,42 @@ async def main_entry(payload: Dict[str, Any]):
         raise HTTPException(400, f"Invalid payload: {e}")
 
     validate_payload(req)
-    await _log_user_message(req)
+    # Persist the user message while guardrails/routing run; it's awaited before
+    # any bot reply is logged so the transcript order is preserved.
+    user_log = asyncio.create_task(_log_user_message(req))
+
+    # Convert history to plain dicts once; guardrails and both routers use this form
+    history = [{"role": h.role, "content": h.content} for h in req.history]
 
     # security guardrails - pass history for context-aware domain grounding
     if req.type == "text":
-        # Convert history to format expected by security guardrails
-        history_for_validation = [{"role": h.role, "content": h.content} for h in req.history] if req.history else []
         ok_sec, msg, meta = guardrails.validate_input(
             req.user_id, 
             req.message or "", 
             req.type, 
             req.speciality,
-            history=history_for_validation
+            history=history
         )
         if not ok_sec:
             response = err(req.chat_id, msg, meta.get("error_type", "security"), meta)
+            await user_log
             await _log_bot_message(req, response)
             return response
 
     # route message/image
     try:
-        response = await (_route_text(req) if req.type == "text" else _route_image_then_report(req))
+        response = await (
+            _route_text(req, history) if req.type == "text" else _route_image_then_report(req, history)
+        )
+        await user_log
         await _log_bot_message(req, response)
         return response
     except HTTPException:
+        await user_log
         raise
     except Exception as e:
         response = err(req.chat_id, "Internal server error", "internal_error", {"detail": str(e)})
+        await user_log
         await _log_bot_message(req, response)
         return response
 
@@ -10,8 +10,9 @@ Handles Supervisor Agent persistence:
 """
 
 import os
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 from google.cloud import firestore, storage
 from google.api_core import exceptions as gcloud_exceptions
@@ -22,6 +23,8 @@ from google.api_core import exceptions as gcloud_exceptions
 FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")
 FIRESTORE_COLLECTION = os.getenv("FIRESTORE_COLLECTION", "chats")
 FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET")
+MISSING_DOC_TTL_SECONDS = 30  # how long a "document does not exist" answer is reused
+MISSING_DOC_CACHE_MAXSIZE = 10_000  # per process; oldest entries are evicted first
 
 if not FIREBASE_PROJECT_ID:
     raise RuntimeError("❌ FIREBASE_PROJECT_ID is missing in environment variables.")
@@ -56,6 +59,37 @@ class FirestoreService:
         self.db = get_firestore()
         self.bucket_name = FIREBASE_STORAGE_BUCKET
         self.bucket = get_storage().bucket(self.bucket_name) if self.bucket_name else None
+        # (collection, doc_id) -> expiry, oldest first; per process, so another instance
+        # (or the frontend) creating the doc is only seen once the entry expires
+        self._missing_docs: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    # =====================================================
+    # 🔹 Negative cache (repeated lookups of missing docs)
+    # =====================================================
+    def _is_known_missing(self, collection_path: str, doc_id: str) -> bool:
+        key = (collection_path, doc_id)
+        expires_at = self._missing_docs.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            self._missing_docs.pop(key, None)
+            return False
+        return True
+
+    def _mark_missing(self, collection_path: str, doc_id: str) -> None:
+        now = time.monotonic()
+        key = (collection_path, doc_id)
+        self._missing_docs[key] = now + MISSING_DOC_TTL_SECONDS
+        self._missing_docs.move_to_end(key)
+        # Every entry has the same TTL, so insertion order is expiry order
+        while self._missing_docs:
+            oldest_key, expires_at = next(iter(self._missing_docs.items()))
+            if expires_at >= now and len(self._missing_docs) <= MISSING_DOC_CACHE_MAXSIZE:
+                break
+            self._missing_docs.pop(oldest_key)
+
+    def _mark_present(self, collection_path: str, doc_id: str) -> None:
+        self._missing_docs.pop((collection_path, doc_id), None)
 
     # =====================================================
     # 🔹 Chat Messages
@@ -76,6 +110,7 @@ class FirestoreService:
         try:
             message["createdAt"] = firestore.SERVER_TIMESTAMP
             self.db.collection(FIRESTORE_COLLECTION).document(chat_id).collection("messages").add(message)
+            self._mark_present(FIRESTORE_COLLECTION, chat_id)
             return True
         except Exception as e:
             print(f"🔥 Firestore save_message error: {e}")
@@ -105,6 +140,37 @@ class FirestoreService:
             print(f"🔥 Firestore get_chat_history error: {e}")
             return []
 
+    # =====================================================
+    # 🔹 Chat Metadata (collected_info from specialist agents)
+    # =====================================================
+    def save_user_metadata(self, chat_id: str, metadata: Dict[str, Any]) -> bool:
+        """Merge collected patient info into the chat document (latest values overwrite)."""
+        try:
+            self.db.collection(FIRESTORE_COLLECTION).document(chat_id).set(
+                {"user_metadata": metadata},
+                merge=True,
+            )
+            self._mark_present(FIRESTORE_COLLECTION, chat_id)
+            return True
+        except Exception as e:
+            print(f"🔥 Firestore save_user_metadata error: {e}")
+            return False
+
+    def get_user_metadata(self, chat_id: str) -> Dict[str, Any]:
+        """Fetch collected patient info for a chat ({} if none saved yet)."""
+        if self._is_known_missing(FIRESTORE_COLLECTION, chat_id):
+            return {}
+        try:
+            doc = self.db.collection(FIRESTORE_COLLECTION).document(chat_id).get()
+            if not doc.exists:
+                print("⚠️  Chat document not found in Firestore, user_metadata will be empty")
+                self._mark_missing(FIRESTORE_COLLECTION, chat_id)
+                return {}
+            return (doc.to_dict() or {}).get("user_metadata", {})
+        except Exception as e:
+            print(f"⚠️  Could not fetch user_metadata from Firestore: {e}")
+            return {}
+
     # =====================================================
     # 🔹 Vision Agent Results
     # =====================================================
@@ -125,6 +191,7 @@ class FirestoreService:
                 **result
             }
             self.db.collection(FIRESTORE_COLLECTION).document(chat_id).collection("vision").add(data)
+            self._mark_present(FIRESTORE_COLLECTION, chat_id)
             return True
         except Exception as e:
             print(f"🔥 Firestore log_vision_result error: {e}")
@@ -145,7 +212,14 @@ class FirestoreService:
         """
         try:
             report_data["timestamp"] = firestore.SERVER_TIMESTAMP
-            self.db.collection(FIRESTORE_COLLECTION).document(chat_id).collection("reports").add(report_data)
+            chat_ref = self.db.collection(FIRESTORE_COLLECTION).document(chat_id)
+            # Keep a denormalized counter on the chat doc in the same atomic write,
+            # so dashboards read one document instead of scanning reports.
+            batch = self.db.batch()
+            batch.set(chat_ref.collection("reports").document(), report_data)
+            batch.set(chat_ref, {"report_count": firestore.Increment(1)}, merge=True)
+            batch.commit()
+            self._mark_present(FIRESTORE_COLLECTION, chat_id)
             return True
         except Exception as e:
             print(f"🔥 Firestore save_report error: {e}")
@@ -169,11 +243,9 @@ class FirestoreService:
             if not self.bucket:
                 raise RuntimeError("Firebase Storage bucket not configured")
 
+            # Signing is done locally with the service credentials, so skip the
+            # blob.exists() metadata round-trip; a missing object simply 404s on GET.
             blob = self.bucket.blob(image_path)
-            if not blob.exists():
-                print(f"⚠️ Image not found in storage: {image_path}")
-                return None
-
             url = blob.generate_signed_url(
                 expiration=expiry_seconds,
                 method="GET",
@@ -189,10 +261,15 @@ class FirestoreService:
     # =====================================================
     def get_document(self, collection_path: str, doc_id: str) -> Optional[Dict[str, Any]]:
         """Fetch any single document by ID."""
+        if self._is_known_missing(collection_path, doc_id):
+            return None
         try:
             doc_ref = self.db.collection(collection_path).document(doc_id)
             doc = doc_ref.get()
-            return doc.to_dict() if doc.exists else None
+            if not doc.exists:
+                self._mark_missing(collection_path, doc_id)
+                return None
+            return doc.to_dict()
         except Exception as e:
             print(f"🔥 Firestore get_document error: {e}")
             return None
@@ -206,7 +283,7 @@ class FirestoreService:
             # Try listing top-level chat IDs
             _ = list(self.db.collection(FIRESTORE_COLLECTION).limit(1).stream())
             if self.bucket_name:
-                _ = next(self.bucket.list_blobs(max_results=1), None)
+                _ = next(self.bucket.list_blobs(max_results=1, fields="items(name)"), None)
             return True
         except Exception as e:
             print(f"⚠️ Firestore/Storage health check failed: {e}")
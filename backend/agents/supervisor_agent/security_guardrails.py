@@ -5,7 +5,9 @@ Production-Grade Medical Domain Guardrails
 Designed for natural medical conversations with proper safety boundaries
 """
 import re, time, html
-from typing import Tuple, Dict, List, Optional
+from collections import deque
+from functools import lru_cache
+from typing import Tuple, Dict, List
 
 # ==============================================================================
 # MEDICAL DOMAIN KNOWLEDGE BASE
@@ -63,6 +65,9 @@ started stopped changed
 it its they them this that these those
 """.split())
 
+# Short acknowledgements that mark a reply as a follow-up in an active consultation
+FOLLOWUP_WORDS = frozenset(['yes', 'no', 'it', 'its', 'this', 'that'])
+
 # Combined medical context vocabulary
 MEDICAL_CONTEXT = MEDICAL_KEYWORDS | BODY_PARTS | DESCRIPTORS | PERSONAL_INFO | CONVERSATIONAL
 
@@ -71,20 +76,83 @@ MEDICAL_CONTEXT = MEDICAL_KEYWORDS | BODY_PARTS | DESCRIPTORS | PERSONAL_INFO |
 # SECURITY PATTERNS
 # ==============================================================================
 
-PRIVATE_IP_RE = re.compile(
-    r"(^127\.0\.0\.1)|(^10\.)|(^172\.(1[6-9]|2\d|3[0-1])\.)|(^192\.168\.)|(^0\.)|(^169\.254\.)"
-)
-
 INJECTION_PATTERNS = [
-    r"(?i)\bignore (all|previous) (instructions|rules|prompts)\b",
-    r"(?i)\bdisregard (the )?(system|previous|prior) (prompt|instruction)\b",
-    r"(?i)\boverride (the )?(safety|security|system)\b",
-    r"(?i)\byou are (now |)chatgpt\b",
-    r"(?i)\bpretend (you|to) (are|be)\b.*\b(not|different)\b",
-    r"(?i)\breset (your|the) (instructions|rules|system)\b",
+    r"\bignore (all|previous) (instructions|rules|prompts)\b",
+    r"\bdisregard (the )?(system|previous|prior) (prompt|instruction)\b",
+    r"\boverride (the )?(safety|security|system)\b",
+    r"\byou are (now |)chatgpt\b",
+    r"\bpretend (you|to) (are|be)\b.*\b(not|different)\b",
+    r"\breset (your|the) (instructions|rules|system)\b",
 ]
+# All injection patterns as one alternation: a single scan per message
+INJECTION_RE = re.compile(
+    "|".join(f"(?:{p})" for p in INJECTION_PATTERNS), re.IGNORECASE
+)
+
+TOKEN_RE = re.compile(r'[a-z]+')
+
+
+@lru_cache(maxsize=1024)
+def _tokenize(text: str) -> frozenset:
+    """Lowercase word tokens of a message.
+
+    Cached because the same history messages are re-tokenized on every turn
+    of a conversation (the client resends the recent history each time).
+    """
+    return frozenset(TOKEN_RE.findall(text.lower()))
+
+
+# Emergency/crisis language, checked before anything else in content moderation
+CRISIS_RE = re.compile(
+    r'\b(suicide|kill myself|end my life|want to die)\b'
+    r'|\b(self.harm|cutting myself|hurt myself)\b',
+    re.IGNORECASE
+)
+
+# Specialty cue words used by domain grounding, matched as whole words so that
+# "arm" doesn't fire inside "warm"/"charm" or "back" inside "feedback".
+# Compound and inflected forms are listed explicitly ("forearm", "birthmark").
+# Each list is compiled into one alternation so a message is scanned once in C
+# instead of once per word.
+SPECIALTY_KEYWORDS = {
+    "skin": [
+        "skin", "derm", "derma", "dermatologist", "dermatology", "dermatitis",
+        "face", "facial", "body", "area", "areas",
+        "spot", "spots", "spotted", "sunspot", "sunspots",
+        "mark", "marks", "birthmark", "birthmarks", "stretchmark", "stretchmarks",
+    ],
+    "oral": [
+        "tooth", "teeth", "toothache", "mouth", "dental", "dentist",
+        "bite", "bites", "biting", "chew", "chews", "chewing",
+        "taste", "tastes", "tasting",
+    ],
+}
+SPECIALTY_CONTEXT = {
+    "skin": [
+        "skin", "derm", "derma", "dermatologist", "dermatology", "dermatitis",
+        "rash", "rashes", "mole", "moles", "itch", "itches", "itchy", "itching",
+        "face", "facial", "arm", "arms", "forearm", "forearms", "underarm", "underarms",
+        "armpit", "armpits", "leg", "legs", "back",
+        "birthmark", "birthmarks", "stretchmark", "stretchmarks", "sunspot", "sunspots",
+    ],
+    "oral": [
+        "tooth", "teeth", "toothache", "gum", "gums", "mouth", "dental", "dentist",
+        "bite", "bites", "biting", "jaw", "jaws", "tongue",
+    ],
+}
+
+
+def _word_alternation(words: List[str]) -> "re.Pattern":
+    # IGNORECASE lets callers search the raw text instead of a lowercased copy
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b", re.IGNORECASE)
+
+
+SPECIALTY_KEYWORDS_RE = {spec: _word_alternation(words) for spec, words in SPECIALTY_KEYWORDS.items()}
+SPECIALTY_CONTEXT_RE = {spec: _word_alternation(words) for spec, words in SPECIALTY_CONTEXT.items()}
 
-DISALLOWED_IMAGE_HOSTS = [r"localhost", r"file:", r"metadata\.googleinternal"]
+# Longest text message accepted; checked before any regex/tokenizing work
+MAX_MESSAGE_CHARS = 8000
+MESSAGE_TOO_LONG = f"Message too long. Please keep messages under {MAX_MESSAGE_CHARS} characters."
 
 
 # ==============================================================================
@@ -95,7 +163,7 @@ class RateLimiter:
     """Token bucket rate limiter with separate limits for text and image requests"""
     
     def __init__(self):
-        self.bucket = {}  # key -> [(timestamp...)]
+        self.bucket = {}  # key -> deque of timestamps, oldest first
         self.limits = {
             "text": (30, 60),      # 30 requests per 60 seconds
             "image": (5, 3600)     # 5 requests per hour
@@ -107,19 +175,21 @@ class RateLimiter:
         key = (user_id, kind)
         
         # Initialize or get request history
-        if key not in self.bucket:
-            self.bucket[key] = []
+        history = self.bucket.get(key)
+        if history is None:
+            history = self.bucket[key] = deque()
         
-        # Remove expired timestamps
-        self.bucket[key] = [t for t in self.bucket[key] if now - t < window]
+        # Remove expired timestamps (appended in order, so they're all at the left)
+        while history and now - history[0] >= window:
+            history.popleft()
         
         # Check if limit exceeded
-        if len(self.bucket[key]) >= limit:
-            wait_time = int(window - (now - self.bucket[key][0]))
+        if len(history) >= limit:
+            wait_time = int(window - (now - history[0]))
             return False, f"Rate limit exceeded. Please try again in {wait_time} seconds."
         
         # Add current request
-        self.bucket[key].append(now)
+        history.append(now)
         return True, ""
 
 
@@ -134,9 +204,8 @@ class PromptInjectionDetector:
         if not text:
             return False, ""
         
-        for pattern in INJECTION_PATTERNS:
-            if re.search(pattern, text):
-                return True, "Invalid input detected"
+        if INJECTION_RE.search(text):
+            return True, "Invalid input detected"
         
         return False, ""
 
@@ -177,19 +246,18 @@ class DomainGrounding:
             return True, ""
         
         # Tokenize message
-        text_lower = text.lower()
-        tokens = set(re.findall(r'[a-z]+', text_lower))
+        tokens = _tokenize(text)
         
         # =========================================================================
         # SIGNAL 1: Direct medical keywords
         # =========================================================================
-        if tokens & MEDICAL_KEYWORDS:
+        if not tokens.isdisjoint(MEDICAL_KEYWORDS):
             return True, ""
         
         # =========================================================================
         # SIGNAL 2: Body parts + specialty match
         # =========================================================================
-        has_body_part = bool(tokens & BODY_PARTS)
+        has_body_part = not tokens.isdisjoint(BODY_PARTS)
         if has_body_part:
             # Body part mentioned = likely medical context
             return True, ""
@@ -197,8 +265,8 @@ class DomainGrounding:
         # =========================================================================
         # SIGNAL 3: Medical descriptors (location, time, severity)
         # =========================================================================
-        has_descriptors = bool(tokens & DESCRIPTORS)
         descriptor_count = len(tokens & DESCRIPTORS)
+        has_descriptors = descriptor_count > 0
         
         # Messages like "on my left arm, about halfway up" have many descriptors
         if descriptor_count >= 2 and len(tokens) <= 20:
@@ -208,7 +276,7 @@ class DomainGrounding:
         # =========================================================================
         # SIGNAL 4: Personal medical information
         # =========================================================================
-        has_personal_info = bool(tokens & PERSONAL_INFO)
+        has_personal_info = not tokens.isdisjoint(PERSONAL_INFO)
         if has_personal_info and len(tokens) <= 15:
             # Short messages with age/gender/medical history = relevant context
             return True, ""
@@ -233,7 +301,7 @@ class DomainGrounding:
                 is_followup_response = (
                     len(tokens) <= 20 or  # Short responses
                     has_descriptors or     # Location/time descriptors
-                    any(w in tokens for w in ['yes', 'no', 'it', 'its', 'this', 'that'])  # Conversational
+                    not tokens.isdisjoint(FOLLOWUP_WORDS)  # Conversational
                 )
                 
                 if is_followup_response:
@@ -246,12 +314,7 @@ class DomainGrounding:
         # Allow ambiguous but potentially medical messages
         if speciality in ["skin", "oral"]:
             # Check for specialty-specific context
-            specialty_keywords = {
-                "skin": ["skin", "derma", "face", "body", "area", "spot", "mark"],
-                "oral": ["tooth", "teeth", "mouth", "dental", "bite", "chew", "taste"]
-            }
-            
-            if any(word in text_lower for word in specialty_keywords.get(speciality, [])):
+            if SPECIALTY_KEYWORDS_RE[speciality].search(text):
                 return True, ""
             
             # Allow very short messages in specialty context (likely answers to questions)
@@ -261,21 +324,8 @@ class DomainGrounding:
         # =========================================================================
         # REJECTION: No medical context detected
         # =========================================================================
-        # Only reject if clearly off-topic
-        
-        # Check for obviously non-medical content
-        non_medical_patterns = [
-            r'\b(weather|sports|politics|news|recipe|movie|music)\b',
-            r'\b(how to (make|cook|build|install))\b',
-            r'\b(what is (the|a) (capital|president|weather))\b',
-        ]
-        
-        for pattern in non_medical_patterns:
-            if re.search(pattern, text_lower):
-                return False, self.off_topic_response()
-        
-        # If we reach here: ambiguous message without clear medical context
-        # Decision: Reject with helpful guidance
+        # Clearly off-topic (weather, recipes, ...) and merely ambiguous messages
+        # get the same helpful guidance, so no further pattern scan is needed here.
         return False, self.off_topic_response()
     
     def _analyze_conversation_context(self, history: List, speciality: str) -> bool:
@@ -294,29 +344,23 @@ class DomainGrounding:
         recent_messages = history[-10:] if len(history) > 10 else history
         
         # Combine all message content
-        combined_text = " ".join([
+        contents = [
             msg.get("content", "") if isinstance(msg, dict) else str(msg)
             for msg in recent_messages
-        ]).lower()
+        ]
+        combined_text = " ".join(contents)
         
-        # Tokenize conversation history
-        history_tokens = set(re.findall(r'[a-z]+', combined_text))
+        # Tokenize conversation history (per message, so earlier turns hit the cache)
+        history_tokens = frozenset().union(*map(_tokenize, contents))
         
-        # Check for medical context
-        has_medical_keywords = bool(history_tokens & MEDICAL_KEYWORDS)
-        has_body_parts = bool(history_tokens & BODY_PARTS)
+        # Check for medical context (isdisjoint stops at the first shared word)
+        has_medical_keywords = not history_tokens.isdisjoint(MEDICAL_KEYWORDS)
+        has_body_parts = not history_tokens.isdisjoint(BODY_PARTS)
         has_descriptors = len(history_tokens & DESCRIPTORS) >= 3
         
         # Specialty-specific context
-        specialty_context = {
-            "skin": ["skin", "derma", "rash", "mole", "itch", "face", "arm", "leg", "back"],
-            "oral": ["tooth", "teeth", "gum", "mouth", "dental", "bite", "jaw", "tongue"]
-        }
-        
-        has_specialty_context = any(
-            word in combined_text 
-            for word in specialty_context.get(speciality, [])
-        )
+        specialty_re = SPECIALTY_CONTEXT_RE.get(speciality)
+        has_specialty_context = bool(specialty_re and specialty_re.search(combined_text))
         
         # Consider context established if any strong signal present
         return has_medical_keywords or has_specialty_context or (has_body_parts and has_descriptors)
@@ -345,24 +389,16 @@ class ContentModerator:
         if not text:
             return True, "safe", ""
         
-        text_lower = text.lower()
-        
-        # Emergency/crisis content
-        crisis_patterns = [
-            r'\b(suicide|kill myself|end my life|want to die)\b',
-            r'\b(self.harm|cutting myself|hurt myself)\b',
-        ]
-        
-        for pattern in crisis_patterns:
-            if re.search(pattern, text_lower):
-                return False, "emergency", self.emergency_response()
+        # Emergency/crisis content (case-insensitive pattern, no lowercased copy needed)
+        if CRISIS_RE.search(text):
+            return False, "emergency", self.emergency_response()
         
         # Input validation
-        if len(text) > 8000:
-            return False, "validation", "Message too long. Please keep messages under 8000 characters."
+        if len(text) > MAX_MESSAGE_CHARS:
+            return False, "validation", MESSAGE_TOO_LONG
         
         # Spam/abuse detection (very basic)
-        if len(set(text.lower().split())) < 3 and len(text) > 50:
+        if len(text) > 50 and len(set(text.lower().split())) < 3:
             # Repeated characters or words
             return False, "validation", "Invalid message format"
         
@@ -383,6 +419,12 @@ class ContentModerator:
 # RESPONSE SANITIZER
 # ==============================================================================
 
+# Deletion table for null bytes and control characters (keeps \t, \n, \r)
+_CONTROL_CHARS = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), 0x7f]
+)
+
+
 class ResponseSanitizer:
     """Cleans and sanitizes text output"""
     
@@ -395,7 +437,7 @@ class ResponseSanitizer:
         sanitized = html.escape(text)
         
         # Remove null bytes and control characters
-        sanitized = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f]', '', sanitized)
+        sanitized = sanitized.translate(_CONTROL_CHARS)
         
         return sanitized.strip()
 
@@ -453,6 +495,15 @@ class SecurityOrchestrator:
             self._track_block("rate_limit")
             return False, msg, {"error_type": "rate_limit"}
         
+        # Cheap size check first, so oversized input skips the heavier layers.
+        # Crisis language still gets the emergency response, as it did before.
+        if len(message) > MAX_MESSAGE_CHARS:
+            if CRISIS_RE.search(message):
+                self._track_block("emergency")
+                return False, self.moderator.emergency_response(), {"error_type": "emergency"}
+            self._track_block("validation")
+            return False, MESSAGE_TOO_LONG, {"error_type": "validation"}
+        
         # Layer 2: Prompt injection detection
         suspicious, inj_msg = self.injection_detector.detect(message)
         if suspicious:
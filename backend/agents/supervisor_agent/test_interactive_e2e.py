@@ -4,21 +4,21 @@ Interactive End-to-End Test Script for Supervisor Agent
 Allows user to interact as a customer, upload images, and test complete flow
 """
 
-import requests
 import json
-import time
 from datetime import datetime
 from typing import Dict, Any, Optional
 import argparse
 
+from _test_http import fresh_id, get_session
+
 class InteractiveE2ETester:
     """Interactive end-to-end tester for Supervisor Agent"""
     
     def __init__(self, supervisor_url: str, user_id: Optional[str] = None, chat_id: Optional[str] = None):
         self.supervisor_url = supervisor_url.rstrip('/')
-        self.session = requests.Session()
-        self.user_id = user_id or f"test_user_{int(time.time())}"
-        self.chat_id = chat_id or f"test_chat_{int(time.time())}"
+        self.session = get_session()
+        self.user_id = user_id or fresh_id("test_user")
+        self.chat_id = chat_id or fresh_id("test_chat")
         self.conversation_history = []
         self.image_url = None
         
@@ -0,0 +1,37 @@
+"""
+Unit checks for the supervisor's security guardrails (no server needed)
+Run with: python -m pytest test_security_guardrails.py  (or python test_security_guardrails.py)
+"""
+
+from security_guardrails import DomainGrounding, SPECIALTY_CONTEXT_RE, SPECIALTY_KEYWORDS_RE
+
+
+def test_specialty_cues_match_whole_words_only():
+    skin = SPECIALTY_CONTEXT_RE["skin"]
+    assert skin.search("a rash on my arm")
+    assert skin.search("a spot on my forearm")
+    assert not skin.search("it is warm today")
+    assert not skin.search("what a charm")
+    assert not skin.search("thanks for the feedback")
+    assert not SPECIALTY_CONTEXT_RE["oral"].search("that is a good argument")
+
+
+def test_specialty_keywords_cover_compound_forms():
+    skin = SPECIALTY_KEYWORDS_RE["skin"]
+    assert skin.search("i have a birthmark that changed")
+    assert skin.search("stretchmarks getting darker")
+
+
+def test_domain_grounding_keeps_skin_followups():
+    grounding = DomainGrounding()
+    assert grounding.is_in_domain("I have a birthmark that changed", "skin")[0]
+    assert grounding.is_in_domain("stretchmarks getting darker", "skin")[0]
+    history = [{"role": "user", "content": "I have a birthmark on my forearm"}]
+    assert grounding.is_in_domain("yes", "skin", history)[0]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -3,16 +3,31 @@ Test Script for Supervisor Agent
 Tests the complete flow: text messages → image upload → diagnosis
 """
 
-import requests
 import time
 import json
-from datetime import datetime
+
+from _test_http import fresh_id, get_session, json_body
 
 # Configuration
 SUPERVISOR_URL = "http://localhost:8080"  # Change to your deployed URL
-USER_ID = f"test_user_{int(time.time())}"
-CHAT_ID = f"test_chat_{int(time.time())}"
+USER_ID = fresh_id("test_user")
+CHAT_ID = fresh_id("test_chat")
 SPECIALITY = "skin"
+HEALTH_URL = f"{SUPERVISOR_URL}/health"
+MAIN_API_URL = f"{SUPERVISOR_URL}/api/v1/main"
+BASE_PAYLOAD = {"user_id": USER_ID, "chat_id": CHAT_ID, "speciality": SPECIALITY}
+
+# Follow-up answers sent after the initial complaint in the complete flow
+FOLLOWUP_MESSAGES = (
+    "I'm 35 years old, male",
+    "It's on my left forearm, about halfway up",
+    "It's very itchy, hurts a bit, and seems to be growing",
+    "No skin cancer history, no family history of cancer",
+    "It's been there for about 3 days now and getting worse",
+)
+
+# One keep-alive session for the whole run (no new TCP/TLS handshake per request)
+SESSION = get_session()
 
 def print_separator():
     print("\n" + "="*80 + "\n")
@@ -35,38 +50,28 @@ def test_health_check():
     """Test health endpoint"""
     print("🏥 Testing Health Check...")
     try:
-        response = requests.get(f"{SUPERVISOR_URL}/health")
+        response = SESSION.get(HEALTH_URL)
         response.raise_for_status()
         print("✅ Health check passed!")
-        print(json.dumps(response.json(), indent=2))
+        print(json.dumps(json_body(response), indent=2))
         print_separator()
         return True
     except Exception as e:
         print(f"❌ Health check failed: {e}")
         return False
 
-def send_text_message(message, step):
-    """Send a text message"""
-    print(f"💬 STEP {step}: Sending message...")
-    print(f"Message: {message}")
-    
-    payload = {
-        "message": message,
-        "image_url": "",
-        "user_id": USER_ID,
-        "chat_id": CHAT_ID,
-        "type": "text",
-        "speciality": SPECIALITY
-    }
+def post_main(step, timeout, **fields):
+    """POST one message to /api/v1/main (shared ids merged into the payload)"""
+    payload = {**BASE_PAYLOAD, **fields}
     
     try:
-        response = requests.post(
-            f"{SUPERVISOR_URL}/api/v1/main",
+        response = SESSION.post(
+            MAIN_API_URL,
             json=payload,
-            timeout=60
+            timeout=timeout
         )
         response.raise_for_status()
-        result = response.json()
+        result = json_body(response)
         print_response(step, result)
         return result
     except Exception as e:
@@ -75,50 +80,17 @@ def send_text_message(message, step):
             print(f"Response: {e.response.text}")
         return None
 
+def send_text_message(message, step):
+    """Send a text message"""
+    print(f"💬 STEP {step}: Sending message...")
+    print(f"Message: {message}")
+    return post_main(step, 60, message=message, image_url="", type="text")
+
 def send_image(image_url, step):
     """Send an image"""
     print(f"📸 STEP {step}: Uploading image...")
     print(f"Image URL: {image_url}")
-    
-    payload = {
-        "message": "",
-        "image_url": image_url,
-        "user_id": USER_ID,
-        "chat_id": CHAT_ID,
-        "type": "image",
-        "speciality": SPECIALITY
-    }
-    
-    try:
-        response = requests.post(
-            f"{SUPERVISOR_URL}/api/v1/main",
-            json=payload,
-            timeout=90
-        )
-        response.raise_for_status()
-        result = response.json()
-        print_response(step, result)
-        return result
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        if hasattr(e, 'response') and e.response:
-            print(f"Response: {e.response.text}")
-        return None
-
-def get_session_state():
-    """Get current session state"""
-    print("📊 Fetching session state...")
-    try:
-        response = requests.get(f"{SUPERVISOR_URL}/api/v1/session/{CHAT_ID}")
-        response.raise_for_status()
-        result = response.json()
-        print("✅ Session state retrieved:")
-        print(json.dumps(result, indent=2))
-        print_separator()
-        return result
-    except Exception as e:
-        print(f"❌ Error getting session: {e}")
-        return None
+    return post_main(step, 90, message="", image_url=image_url, type="image")
 
 def run_complete_flow():
     """Run complete test flow"""
@@ -145,60 +117,14 @@ def run_complete_flow():
     
     time.sleep(2)
     
-    # 3. Provide age and gender
-    step += 1
-    result = send_text_message(
-        "I'm 35 years old, male",
-        step
-    )
-    if not result:
-        return
-    
-    time.sleep(2)
-    
-    # 4. Describe body region
-    step += 1
-    result = send_text_message(
-        "It's on my left forearm, about halfway up",
-        step
-    )
-    if not result:
-        return
-    
-    time.sleep(2)
-    
-    # 5. Describe symptoms
-    step += 1
-    result = send_text_message(
-        "It's very itchy, hurts a bit, and seems to be growing",
-        step
-    )
-    if not result:
-        return
-    
-    time.sleep(2)
-    
-    # 6. Additional information
-    step += 1
-    result = send_text_message(
-        "No skin cancer history, no family history of cancer",
-        step
-    )
-    if not result:
-        return
-    
-    time.sleep(2)
-    
-    # 7. Duration
-    step += 1
-    result = send_text_message(
-        "It's been there for about 3 days now and getting worse",
-        step
-    )
-    if not result:
-        return
-    
-    time.sleep(2)
+    # 3-7. Age/gender, body region, symptoms, history, duration
+    for message in FOLLOWUP_MESSAGES:
+        step += 1
+        result = send_text_message(message, step)
+        if not result:
+            return
+        
+        time.sleep(2)
     
     # Check if ready for image
     metadata = result.get('metadata', {})
@@ -236,10 +162,7 @@ def run_complete_flow():
     else:
         print("❌ System not ready for images after conversation")
     
-    # Get final session state
     print_separator()
-    get_session_state()
-    
     print("\n✅ Complete flow test finished!")
     print(f"Chat ID: {CHAT_ID}")
     print(f"You can view this chat in Firestore: chats/{CHAT_ID}")
@@ -272,18 +195,21 @@ if __name__ == "__main__":
     
     choice = input("\nEnter your choice (1-4): ").strip()
     
-    if choice == "1":
-        run_quick_test()
-    elif choice == "2":
-        run_complete_flow()
-    elif choice == "3":
-        test_health_check()
-    elif choice == "4":
-        print("\nCustom test mode")
-        custom_message = input("Enter your message: ")
-        send_text_message(custom_message, 1)
-    else:
-        print("Invalid choice")
+    try:
+        if choice == "1":
+            run_quick_test()
+        elif choice == "2":
+            run_complete_flow()
+        elif choice == "3":
+            test_health_check()
+        elif choice == "4":
+            print("\nCustom test mode")
+            custom_message = input("Enter your message: ")
+            send_text_message(custom_message, 1)
+        else:
+            print("Invalid choice")
+    finally:
+        SESSION.close()
     
     print("\n" + "="*80)
     print("TEST COMPLETE")
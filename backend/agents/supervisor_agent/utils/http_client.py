@@ -14,7 +14,13 @@ class HttpClient:
                     r = await client.post(url, json=payload)
                     r.raise_for_status()
                     return r.json()
+                except httpx.HTTPStatusError as e:
+                    last_err = e
+                    # 4xx won't change on retry; don't redo the downstream work
+                    if e.response.status_code < 500:
+                        break
                 except Exception as e:
                     last_err = e
+                if attempt < self.retries:
                     await asyncio.sleep(0.3 * (attempt + 1))
         raise HTTPException(status_code=502, detail=f"Downstream {url} error: {last_err}")
\ No newline at end of file
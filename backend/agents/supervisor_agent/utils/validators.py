@@ -1,9 +1,11 @@
 # utils/validators.py
 import re
+from functools import lru_cache
 from urllib.parse import urlparse
 from typing import Tuple
 
 SAFE_EXT = (".jpg", ".jpeg", ".png")
+BAD_EXT_MSG = "Only .jpg, .jpeg, and .png images are allowed."
 
 PRIVATE_IP_RE = re.compile(
     r"(^127\.0\.0\.1)|(^0\.)|(^10\.)|(^169\.254\.)|(^172\.(1[6-9]|2\d|3[0-1])\.)|(^192\.168\.)"
@@ -16,8 +18,13 @@ UNSAFE_HOST_RE = re.compile(
     
     
 
+@lru_cache(maxsize=256)
 def validate_image_url(url: str) -> Tuple[bool, str]:
-    """Validates that the image URL is safe and properly formatted."""
+    """Validates that the image URL is safe and properly formatted.
+
+    Pure function of the URL, so results are memoized (client retries and
+    re-submitted uploads skip the parse + regex checks).
+    """
     if not url:
         return False, "image_url is required."
 
@@ -32,15 +39,13 @@ def validate_image_url(url: str) -> Tuple[bool, str]:
         if not parsed.path:
             return False, "Invalid gs:// URL. Path is required."
         # Check extension in path (before any query params)
-        path_lower = parsed.path.lower()
-        if not any(path_lower.endswith(ext) for ext in SAFE_EXT):
-            return False, "Only .jpg, .jpeg, and .png images are allowed."
+        if not parsed.path.lower().endswith(SAFE_EXT):
+            return False, BAD_EXT_MSG
         return True, ""
     
     # For http/https URLs, check the path for extension (ignore query parameters)
-    path_lower = parsed.path.lower()
-    if not any(path_lower.endswith(ext) for ext in SAFE_EXT):
-        return False, "Only .jpg, .jpeg, and .png images are allowed."
+    if not parsed.path.lower().endswith(SAFE_EXT):
+        return False, BAD_EXT_MSG
 
     host = (parsed.hostname or "").lower()
     if not host:
@@ -4,16 +4,58 @@ Provides REST API endpoint for the LangGraph vision agent
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import Literal, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
 import uvicorn
 import os
-from vision_agent import process_vision_request
+
+# vision_agent pulls in LangGraph + Vertex AI and runs vertexai.init(). It is
+# imported in a worker thread at startup so / and /health answer immediately
+# and the event loop never blocks on it; /ready reports whether it loaded.
+_vision_agent = None
+_vision_import_error: Optional[str] = None
+_vision_loading: Optional[asyncio.Task] = None
+
+
+async def _load_vision_agent():
+    global _vision_agent, _vision_import_error
+    try:
+        _vision_agent = await asyncio.to_thread(importlib.import_module, "vision_agent")
+    except Exception as e:
+        _vision_import_error = f"{type(e).__name__}: {e}"
+        print(f"❌ Failed to import vision_agent: {_vision_import_error}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _vision_loading
+    _vision_loading = asyncio.create_task(_load_vision_agent())
+    yield
+
+
+async def get_vision_agent():
+    """The vision_agent module, waiting for the startup import if it is still running"""
+    if _vision_loading is not None:
+        await asyncio.shield(_vision_loading)
+    if _vision_agent is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Vision agent unavailable: {_vision_import_error or 'not loaded'}"
+        )
+    return _vision_agent
+
 
 app = FastAPI(
     title="Vision Agent API",
     description="LangGraph-based vision agent for medical image validation and prediction",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson's native encoder replaces the stdlib json one; no endpoint changes needed
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 
@@ -59,6 +101,18 @@ def health_check():
     }
 
 
+@app.get("/ready")
+def ready():
+    """Readiness check: 503 until vision_agent has imported, or if the import failed"""
+    if _vision_agent is not None:
+        return {"status": "ready"}
+    status = "error" if _vision_import_error else "loading"
+    return ORJSONResponse(
+        status_code=503,
+        content={"status": status, "error": _vision_import_error}
+    )
+
+
 @app.post("/process", response_model=VisionResponse)
 async def process_vision(request: VisionRequest):
     """
@@ -69,8 +123,11 @@ async def process_vision(request: VisionRequest):
     
     Returns validation result and CV model prediction if valid
     """
+    vision_agent = await get_vision_agent()
     try:
-        result = process_vision_request(
+        # The graph does blocking GCS / Vertex AI / HTTP calls; run it off the event loop
+        result = await asyncio.to_thread(
+            vision_agent.process_vision_request,
             chat_id=request.chat_id,
             chat_type=request.chat_type
         )
@@ -89,15 +146,12 @@ async def validate_only(request: VisionRequest):
     Only validate image without getting prediction
     Useful for testing validation logic
     """
+    vision_agent = await get_vision_agent()
     try:
-        from vision_agent import (
-            get_most_recent_image,
-            validate_image_with_gemini,
-            VisionAgentState
-        )
-        
         # Get image
-        image_path = get_most_recent_image(request.chat_id)
+        image_path, mime_type = await asyncio.to_thread(
+            vision_agent.get_most_recent_image_with_type, request.chat_id
+        )
         if not image_path:
             return VisionResponse(
                 chat_id=request.chat_id,
@@ -108,7 +162,9 @@ async def validate_only(request: VisionRequest):
             )
         
         # Validate
-        is_valid, reason = validate_image_with_gemini(image_path, request.chat_type)
+        is_valid, reason = await asyncio.to_thread(
+            vision_agent.validate_image_with_gemini, image_path, request.chat_type, mime_type
+        )
         
         return VisionResponse(
             chat_id=request.chat_id,
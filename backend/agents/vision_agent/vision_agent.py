@@ -7,9 +7,8 @@ from typing import TypedDict, Optional, Literal
 from langgraph.graph import StateGraph, END
 from google.cloud import storage
 import vertexai
-from vertexai.generative_models import GenerativeModel, Part
+from vertexai.generative_models import GenerationConfig, GenerativeModel, Part
 import requests
-import tempfile
 import os
 
 
@@ -18,6 +17,7 @@ class VisionAgentState(TypedDict):
     chat_id: str
     chat_type: Literal["skin", "oral"]
     image_path: Optional[str]
+    image_mime_type: Optional[str]
     is_valid: bool
     validation_reason: str
     prediction_result: Optional[dict]
@@ -34,41 +34,104 @@ LOCATION = os.getenv("GCP_LOCATION", "us-central1")
 # Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
+# Validation only needs {"is_valid", "reason"}; ask for JSON output up front
+VALIDATION_GENERATION_CONFIG = GenerationConfig(response_mime_type="application/json")
 
-def get_most_recent_image(chat_id: str, bucket_name: str = BUCKET_NAME) -> Optional[str]:
-    """Get most recent image from GCS for a chat"""
+_storage_client: Optional[storage.Client] = None
+_validation_model: Optional[GenerativeModel] = None
+_http_session: Optional[requests.Session] = None
+
+
+def get_storage() -> storage.Client:
+    """Singleton Storage client (reuses auth + connection pool across requests)"""
+    global _storage_client
+    if not _storage_client:
+        _storage_client = storage.Client()
+    return _storage_client
+
+
+def get_validation_model() -> GenerativeModel:
+    """Singleton Gemini model used for image validation"""
+    global _validation_model
+    if not _validation_model:
+        _validation_model = GenerativeModel("gemini-2.5-pro")
+    return _validation_model
+
+
+def get_http_session() -> requests.Session:
+    """Singleton HTTP session for the CV model endpoints (keep-alive)"""
+    global _http_session
+    if not _http_session:
+        _http_session = requests.Session()
+    return _http_session
+
+
+def guess_mime_type(image_path: str) -> str:
+    """Fallback mime type from the file extension (defaults to JPEG)"""
+    lower_path = image_path.lower()
+    if lower_path.endswith('.png'):
+        return "image/png"
+    if lower_path.endswith('.webp'):
+        return "image/webp"
+    return "image/jpeg"
+
+
+def get_most_recent_image_with_type(chat_id: str, bucket_name: str = BUCKET_NAME) -> tuple[Optional[str], Optional[str]]:
+    """
+    Get most recent image from GCS for a chat, plus its stored content type
+    
+    The content type comes from the same listing call, so callers don't need to
+    download or sniff the object to know its format.
+    
+    Returns:
+        (gcs_path, content_type) - both None if no image was found
+    """
     try:
-        client = storage.Client()
+        client = get_storage()
         bucket = client.bucket(bucket_name)
         
         prefix = f"chats/{chat_id}/"
-        blobs = list(bucket.list_blobs(prefix=prefix))
+        # Field mask keeps the listing small; pages stream straight into max()
+        most_recent_blob = max(
+            bucket.list_blobs(prefix=prefix, fields="items(name,updated,contentType),nextPageToken"),
+            key=lambda b: b.updated,
+            default=None,
+        )
         
-        if not blobs:
+        if most_recent_blob is None:
             print(f"No images found for chat_id: {chat_id}")
-            return None
+            return None, None
         
-        most_recent_blob = max(blobs, key=lambda b: b.updated)
         gcs_path = f"gs://{bucket_name}/{most_recent_blob.name}"
         
         print(f"✓ Most recent image: {gcs_path}")
         print(f"  Updated at: {most_recent_blob.updated}")
         
-        return gcs_path
+        return gcs_path, most_recent_blob.content_type
     except Exception as e:
         print(f"ERROR getting image: {e}")
-        return None
+        return None, None
+
 
+def get_most_recent_image(chat_id: str, bucket_name: str = BUCKET_NAME) -> Optional[str]:
+    """Get most recent image from GCS for a chat"""
+    return get_most_recent_image_with_type(chat_id, bucket_name)[0]
 
-def validate_image_with_gemini(image_path: str, chat_type: str) -> tuple[bool, str]:
+
+def validate_image_with_gemini(image_path: str, chat_type: str,
+                               mime_type: Optional[str] = None) -> tuple[bool, str]:
     """
     Use Gemini Vision to validate if image matches expected type
     
+    Args:
+        mime_type: Stored content type of the image; guessed from the
+            extension when not provided
+    
     Returns:
         (is_valid, reason)
     """
     try:
-        model = GenerativeModel("gemini-2.5-pro")
+        model = get_validation_model()
         
         if chat_type == "skin":
             prompt = """Analyze this image and determine if it shows human skin or a skin-related condition.
@@ -109,18 +172,18 @@ The image is INVALID if it shows:
 - Non-medical or irrelevant content
 - No human body parts"""
         
-        # Determine mime type
-        mime_type = "image/jpeg"
-        if image_path.lower().endswith('.png'):
-            mime_type = "image/png"
-        elif image_path.lower().endswith('.webp'):
-            mime_type = "image/webp"
+        # Prefer the stored content type; fall back to the file extension
+        if not mime_type or not mime_type.startswith("image/"):
+            mime_type = guess_mime_type(image_path)
         
-        # Generate content
-        response = model.generate_content([
-            prompt,
-            Part.from_uri(image_path, mime_type=mime_type)
-        ])
+        # Generate content (JSON mode: the model emits the object directly, no prose/markdown)
+        response = model.generate_content(
+            [
+                prompt,
+                Part.from_uri(image_path, mime_type=mime_type)
+            ],
+            generation_config=VALIDATION_GENERATION_CONFIG
+        )
         
         result_text = response.text.strip()
         print(f"Gemini response: {result_text}")
@@ -161,35 +224,26 @@ def get_cv_prediction(image_path: str, chat_type: str) -> Optional[dict]:
         bucket_name = image_path.split("/")[2]
         blob_path = "/".join(image_path.split("/")[3:])
         
-        # Download image locally
-        client = storage.Client()
+        # Download image into memory (no temp file write + re-read)
+        client = get_storage()
         bucket = client.bucket(bucket_name)
         blob = bucket.blob(blob_path)
+        image_bytes = blob.download_as_bytes()
         
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-            blob.download_to_filename(tmp.name)
-            tmp_path = tmp.name
+        # Select endpoint
+        endpoint = SKIN_CV_ENDPOINT if chat_type == "skin" else ORAL_CV_ENDPOINT
         
-        try:
-            # Select endpoint
-            endpoint = SKIN_CV_ENDPOINT if chat_type == "skin" else ORAL_CV_ENDPOINT
-            
-            # Send to CV model
-            with open(tmp_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(endpoint, files=files, timeout=30)
-            
-            if response.ok:
-                result = response.json()
-                print(f"✓ CV Prediction received: {result}")
-                return result
-            else:
-                print(f"ERROR from CV model: {response.status_code} - {response.text}")
-                return None
-        finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+        # Send to CV model
+        files = {'file': (os.path.basename(blob_path), image_bytes, blob.content_type or "image/jpeg")}
+        response = get_http_session().post(endpoint, files=files, timeout=30)
+        
+        if response.ok:
+            result = response.json()
+            print(f"✓ CV Prediction received: {result}")
+            return result
+        else:
+            print(f"ERROR from CV model: {response.status_code} - {response.text}")
+            return None
                 
     except Exception as e:
         print(f"ERROR getting prediction: {e}")
@@ -197,29 +251,29 @@ def get_cv_prediction(image_path: str, chat_type: str) -> Optional[dict]:
 
 
 # LangGraph Node Functions
+# Nodes return only the keys they change; LangGraph merges them into the state.
 
-def fetch_image_node(state: VisionAgentState) -> VisionAgentState:
+def fetch_image_node(state: VisionAgentState) -> dict:
     """Fetch most recent image from GCS"""
     print(f"\n=== Fetching Image ===")
     print(f"Chat ID: {state['chat_id']}, Type: {state['chat_type']}")
     
-    image_path = get_most_recent_image(state['chat_id'])
+    image_path, mime_type = get_most_recent_image_with_type(state['chat_id'])
     
     if not image_path:
         return {
-            **state,
             "is_valid": False,
             "validation_reason": "No image found for this chat_id",
             "error": "Image not found"
         }
     
     return {
-        **state,
-        "image_path": image_path
+        "image_path": image_path,
+        "image_mime_type": mime_type
     }
 
 
-def validate_image_node(state: VisionAgentState) -> VisionAgentState:
+def validate_image_node(state: VisionAgentState) -> dict:
     """Validate image matches chat_type using Gemini"""
     print(f"\n=== Validating Image ===")
     
@@ -228,17 +282,17 @@ def validate_image_node(state: VisionAgentState) -> VisionAgentState:
     
     is_valid, reason = validate_image_with_gemini(
         state['image_path'],
-        state['chat_type']
+        state['chat_type'],
+        state.get('image_mime_type')
     )
     
     return {
-        **state,
         "is_valid": is_valid,
         "validation_reason": reason
     }
 
 
-def get_prediction_node(state: VisionAgentState) -> VisionAgentState:
+def get_prediction_node(state: VisionAgentState) -> dict:
     """Get prediction from CV model"""
     print(f"\n=== Getting CV Prediction ===")
     
@@ -253,12 +307,10 @@ def get_prediction_node(state: VisionAgentState) -> VisionAgentState:
     
     if prediction is None:
         return {
-            **state,
             "error": "Failed to get prediction from CV model"
         }
     
     return {
-        **state,
         "prediction_result": prediction
     }
 
@@ -297,6 +349,17 @@ def create_vision_agent_graph():
     return workflow.compile()
 
 
+_vision_graph = None
+
+
+def get_vision_graph():
+    """Compiled graph singleton (the workflow is static, so compile it once)"""
+    global _vision_graph
+    if _vision_graph is None:
+        _vision_graph = create_vision_agent_graph()
+    return _vision_graph
+
+
 # Main execution function
 def process_vision_request(chat_id: str, chat_type: Literal["skin", "oral"]) -> dict:
     """
@@ -318,14 +381,15 @@ def process_vision_request(chat_id: str, chat_type: Literal["skin", "oral"]) ->
         chat_id=chat_id,
         chat_type=chat_type,
         image_path=None,
+        image_mime_type=None,
         is_valid=False,
         validation_reason="",
         prediction_result=None,
         error=None
     )
     
-    # Create and run graph
-    graph = create_vision_agent_graph()
+    # Run graph
+    graph = get_vision_graph()
     final_state = graph.invoke(initial_state)
     
     # Prepare response